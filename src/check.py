@@ -17,8 +17,8 @@ if __name__ == "__main__":
     print("check tool usable ...")
     is_usable = SonarQube.check_usable()
     result_path = "check_result.json"
-    if os.path.exists(result_path):
-        os.remove(result_path)
-    with open(result_path, "w") as fp:
+    temp_path = result_path + ".tmp"
+    with open(temp_path, "w") as fp:
         data = {"usable": is_usable}
         json.dump(data, fp)
+    os.replace(temp_path, result_path)
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+# Copyright (c) 2022 THL A29 Limited
+#
+# This source code file is made available under LGPL License
+# See LICENSE for details
+# ==============================================================================
+
+"""
+Shared entry of the SonarQube tools
+"""
+
+import os
+import functools
+
+from util import jsonlib
+
+
+@functools.lru_cache(maxsize=1)
+def _load_task_request():
+    task_request_file = os.environ.get("TASK_REQUEST")
+    print("[debug] task_request_file: %s" % task_request_file)
+    with open(task_request_file, "rb") as rf:
+        return jsonlib.load(rf)
+
+
+class BaseSonarQubeEntry(object):
+    def __init__(self):
+        self.source_dir = os.environ.get("SOURCE_DIR", None)
+        print("[debug] source_dir: %s" % self.source_dir)
+        self.task_params = self.__get_task_params()
+
+    def __get_task_params(self):
+        task_request = _load_task_request()
+        task_params = dict(task_request["task_params"])
+        task_params["task_dir"] = task_request["task_dir"]
+        return task_params
+
+    @property
+    def build_cwd(self):
+        build_cwd = os.environ.get("BUILD_CWD", None)
+        return os.path.join(self.source_dir, build_cwd) if build_cwd else self.source_dir
+
+    def dump_result(self, issues):
+        with open("result.json", "w", encoding="utf-8") as fp:
+            jsonlib.dump(issues, fp, indent=2)
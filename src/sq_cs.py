@@ -10,33 +10,17 @@
 SonarQube for C#
 """
 
-import os
-import json
-
+from sq_base import BaseSonarQubeEntry
 from util.sq import SonarQube
 
 
-class SonarQubeCs(object):
-    def __init__(self):
-        self.source_dir = os.environ.get("SOURCE_DIR", None)
-        print("[debug] source_dir: %s" % self.source_dir)
-        self.task_params = self.__get_task_params()
-
-    def __get_task_params(self):
-        task_request_file = os.environ.get("TASK_REQUEST")
-        print("[debug] task_request_file: %s" % task_request_file)
-        with open(task_request_file, "r") as rf:
-            task_request = json.load(rf)
-        task_params = task_request["task_params"]
-        return task_params
-
+class SonarQubeCs(BaseSonarQubeEntry):
     def run(self):
         """
         :return:
         """
         build_cmd = self.task_params["build_cmd"]
-        build_cwd = os.environ.get("BUILD_CWD", None)
-        build_cwd = os.path.join(self.source_dir, build_cwd) if build_cwd else self.source_dir
+        build_cwd = self.build_cwd
 
         sonar_scanner = SonarQube(self.task_params)
         sonar_scanner.pre_cmd(build_cwd)
@@ -44,8 +28,7 @@ class SonarQubeCs(object):
             sonar_scanner.scan_cs_proj, languages="cs", build_cmd=build_cmd, build_cwd=build_cwd
         )
 
-        with open("result.json", "w") as fp:
-            json.dump(issues, fp, indent=2)
+        self.dump_result(issues)
 
 
 tool = SonarQubeCs
@@ -10,11 +10,15 @@
 import os
 import re
 import json
+import hashlib
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from tomd import Tomd
 
 import settings
 from util.api import SQAPIHandler
+from util.rule_cache import get_or_build
 
 
 # INFO MINOR -> info
@@ -58,9 +62,145 @@ LANGUAGE_MAP = {
 }
 
 
+_SPLIT_RE = re.compile(r"[:\-]")
+
+
 def display_name(name):
-    pieces = re.split(":|-", name)
-    return "".join([piece.capitalize() for piece in pieces])
+    return "".join(piece.capitalize() for piece in _SPLIT_RE.split(name))
+
+
+RULE_SETS = {
+    "sq": ",".join([
+        # "vbnet",
+        "css",
+        "flex",
+        "go",
+        "js",
+        "kotlin",
+        "php",
+        "py",
+        "ruby",
+        "scala",
+        "ts",
+        "web",
+        "xml",
+    ]),
+    "sq_cs": "cs",
+    "sq_java": ",".join([
+        "java",
+        "jsp",
+    ]),
+}
+
+
+# language -> key of the rule set it belongs to
+RULE_SET_OF_LANG = {lang: key for key, langs in RULE_SETS.items() for lang in langs.split(",")}
+
+
+# placeholder of checkrule_set while dumping the rest of the config
+CHECKRULE_SET_MARK = "__checkrule_set__"
+
+
+def build_rule(rule):
+    return {
+        "real_name": rule["key"],
+        # 64 char
+        "display_name": display_name(rule["key"]),
+        "severity": SEVERITY_MAP[rule["severity"]],
+        "category": TYPE_MAP[rule["type"]],
+        "rule_title": rule["name"],
+        "rule_params": None,
+        "custom": False,
+        "languages": [
+            LANGUAGE_MAP[rule["lang"]]
+        ],
+        "solution": None,
+        "owner": None,
+        "labels": [],
+        "description": Tomd(rule["mdDesc"]).markdown if rule["mdDesc"].startswith("<p>") else rule["mdDesc"],
+        "disable": False
+    }
+
+
+def fetch_rules(handler):
+    """
+    Walk the rules of all rule sets once and group them by rule set
+    :param handler: SQAPIHandler
+    :return: {rule set key: [rule, ...]}
+    """
+    rule_sets = defaultdict(list)
+    for rule in handler.get_rules(
+        active_only=True,
+        languages=",".join(RULE_SETS.values()),
+        f="name,severity,lang,mdDesc",
+    ):
+        # print(rule)
+        rule_sets[RULE_SET_OF_LANG[rule["lang"]]].append(rule)
+    return rule_sets
+
+
+def iter_rules(raw_rules):
+    # local names for the per rule loop
+    sha256 = hashlib.sha256
+    dumps = json.dumps
+    cached_rule = get_or_build
+    build = build_rule
+    for rule in raw_rules:
+        # hash every fetched field, not only mdDesc, so severity/type changes also refresh the cache
+        rule_hash = sha256(dumps(rule, sort_keys=True).encode()).hexdigest()
+        yield cached_rule(rule["key"], rule_hash, lambda: build(rule))
+
+
+def dump_config(config, rules, fp):
+    """
+    Write config with rules streamed into its checkrule_set, formatted like json.dump(indent=2)
+    :param config: config loaded from config/{key}.json
+    :param rules: iterable of rules
+    :param fp: output file
+    :return:
+    """
+    config[0]["checkrule_set"] = CHECKRULE_SET_MARK
+    prefix, suffix = json.dumps(config, indent=2, ensure_ascii=False).split(json.dumps(CHECKRULE_SET_MARK), 1)
+    last_line = prefix.rsplit("\n", 1)[-1]
+    indent = last_line[:len(last_line) - len(last_line.lstrip())]
+    rule_indent = indent + "  "
+
+    write = fp.write
+    dumps = json.dumps
+    write(prefix)
+    sep = "[\n"
+    for rule in rules:
+        write(sep + rule_indent + dumps(rule, indent=2, ensure_ascii=False).replace("\n", "\n" + rule_indent))
+        sep = ",\n"
+    write("[]" if sep == "[\n" else "\n" + indent + "]")
+    write(suffix)
+
+
+def file_digest(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def build_ruleset(key, raw_rules):
+    f = open(os.path.join(os.path.dirname(settings.TOOL_DIR), "config", f"{key}.json"), encoding="utf-8")
+    config = json.load(f)
+    f.close()
+
+    out_dir = os.path.join(os.path.dirname(settings.TOOL_DIR), "config-new")
+    os.makedirs(out_dir, exist_ok=True)
+    out_path = os.path.join(out_dir, f"{key}.json")
+    temp_path = f"{out_path}.tmp"
+    f = open(temp_path, "w", encoding="utf-8")
+    dump_config(config, iter_rules(raw_rules), f)
+    f.close()
+    # leave an unchanged config untouched, so its mtime and VCS state stay as they are
+    if file_digest(temp_path) == file_digest(out_path):
+        os.remove(temp_path)
+        print(f"{key}.json is unchanged")
+    else:
+        os.replace(temp_path, out_path)
 
 
 if __name__ == "__main__":
@@ -68,64 +208,10 @@ if __name__ == "__main__":
         user=settings.SQ_LOCAL_USER["username"],
         password=settings.SQ_LOCAL_USER["password"],
     )
+    rule_sets = fetch_rules(handler)
 
-    for key, lang in {
-        "sq": ",".join([
-            # "vbnet",
-            "css",
-            "flex",
-            "go",
-            "js",
-            "kotlin",
-            "php",
-            "py",
-            "ruby",
-            "scala",
-            "ts",
-            "web",
-            "xml",
-        ]),
-        "sq_cs": "cs",
-        "sq_java": ",".join([
-            "java",
-            "jsp",
-        ]),
-    }.items():
-        rules = list()
-        for rule in handler.get_rules(
-            active_only=True,
-            languages=lang,
-            f="name,severity,lang,mdDesc",
-        ):
-            # print(rule)
-            rules.append({
-                "real_name": rule["key"],
-                # 64 char
-                "display_name": display_name(rule["key"]),
-                "severity": SEVERITY_MAP[rule["severity"]],
-                "category": TYPE_MAP[rule["type"]],
-                "rule_title": rule["name"],
-                "rule_params": None,
-                "custom": False,
-                "languages": [
-                    LANGUAGE_MAP[rule["lang"]]
-                ],
-                "solution": None,
-                "owner": None,
-                "labels": [],
-                "description": Tomd(rule["mdDesc"]).markdown if rule["mdDesc"].startswith("<p>") else rule["mdDesc"],
-                "disable": False
-            })
-
-        f = open(os.path.join(os.path.dirname(settings.TOOL_DIR), "config", f"{key}.json"))
-        config = json.load(f)
-        f.close()
-        config[0]["checkrule_set"] = rules
-
-        out_dir = os.path.join(os.path.dirname(settings.TOOL_DIR), "config-new")
-        if not os.path.exists(out_dir):
-            os.mkdir(out_dir)
-        f = open(os.path.join(out_dir, f"{key}.json"), "w")
-        json.dump(config, f, indent=2, ensure_ascii=False)
-        f.close()
-    
+    # rule conversion is CPU bound, build every rule set in its own process
+    with ProcessPoolExecutor(max_workers=len(RULE_SETS)) as executor:
+        futures = [executor.submit(build_ruleset, key, rule_sets[key]) for key in RULE_SETS]
+        for future in as_completed(futures):
+            future.result()
@@ -7,27 +7,69 @@
 # ==============================================================================
 
 
+import math
 import operator
 import requests
 import logging
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 
+from util import jsonlib
 from util.exceptions import ClientError, ServerError, AuthError, ValidationError
 
 logging.getLogger("requests").setLevel(logging.WARNING)
 
+# maximum page size accepted by the SonarQube search endpoints
+PAGE_SIZE = 500
+# bounded to stay clear of the server rate limit
+PAGE_WORKERS = 8
+# /api/issues/search answers 400 for pages past the first 10000 results
+ISSUES_MAX_RESULTS = 10000
+
+
+def _json(res):
+    return jsonlib.loads(res.content)
+
+
+def _params(**params):
+    # optional arguments left as None are not sent
+    return {k: v for k, v in params.items() if v is not None}
+
 
 class SQAPIHandler(object):
+    __slots__ = ("_host", "_port", "_base_path", "_session")
+
     def __init__(self, host="http://localhost", port=9000, base_path="", user=None, password=None, token=None):
         self._host = host
         self._port = port
         self._base_path = base_path
         self._session = requests.Session()
+        # keep connections alive across paginated calls and retry gateway errors
+        # raise_on_status=False hands the last 5xx response to _request, which raises ServerError
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=16,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504], raise_on_status=False),
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
         # auth
         if token:
             self._session.auth = token, ""
         elif user and password:
             self._session.auth = user, password
 
+    def clone(self):
+        """
+        Handler of the same server and credentials with a session of its own, for use in another thread
+        :return: SQAPIHandler
+        """
+        handler = SQAPIHandler(host=self._host, port=self._port, base_path=self._base_path)
+        handler._session.auth = self._session.auth
+        return handler
+
     def _get_url(self, endpoint):
         return f"{self._host}:{self._port}{self._base_path}{endpoint}"
 
@@ -41,7 +83,7 @@ class SQAPIHandler(object):
             return res
         elif res.status_code == 400:
             # Validation error
-            msg = ", ".join(e["msg"] for e in res.json()["errors"])
+            msg = ", ".join(e["msg"] for e in _json(res)["errors"])
             raise ValidationError(msg)
         elif res.status_code in (401, 403):
             # Auth error
@@ -53,6 +95,39 @@ class SQAPIHandler(object):
             # 5xx is server error
             raise ServerError(res.reason)
 
+    def _get_pages(self, method, endpoint, params, paging=None, max_results=None):
+        """
+        Fetch the first page to learn the total, then the remaining pages concurrently.
+        :param paging: key of the paging object in the response, None if p/ps/total are top level
+        :param max_results: results the endpoint can page through at most, None if unlimited
+        :return: page responses, in page order
+        """
+        res = _json(self._request(method, endpoint, **params))
+        yield res
+
+        if paging:
+            page_size = res[paging]["pageSize"]
+            total = res[paging]["total"]
+        else:
+            page_size = res["ps"]
+            total = res["total"]
+        if max_results is not None and total > max_results:
+            print(
+                f"[warning] {endpoint} only pages through {max_results} of {total} results, "
+                f"{total - max_results} not fetched"
+            )
+            total = max_results
+        n_pages = math.ceil(total / page_size) if page_size else 1
+        if n_pages < 2:
+            return
+
+        def get_page(page_num):
+            return _json(self._request(method, endpoint, **params, p=page_num))
+
+        with ThreadPoolExecutor(max_workers=min(PAGE_WORKERS, n_pages - 1)) as executor:
+            for res in executor.map(get_page, range(2, n_pages + 1)):
+                yield res
+
     def activate_rule(self, key, profile_key, reset=False, severity=None, **params):
         data = {"rule_key": key, "profile_key": profile_key, "reset": reset and "true" or "false"}
 
@@ -60,9 +135,10 @@ class SQAPIHandler(object):
             if severity:
                 data["severity"] = severity.upper()
 
-            params = ";".join(f"{k}={v}" for k, v in sorted(params.items()) if v)
             if params:
-                data["params"] = params
+                params = ";".join(f"{k}={v}" for k, v in sorted(params.items()) if v)
+                if params:
+                    data["params"] = params
 
         res = self._request("post", "/api/qualityprofiles/activate_rule", **data)
         return res
@@ -82,29 +158,18 @@ class SQAPIHandler(object):
         return res
 
     def get_metrics(self, fields=None):
-        qs = {}
+        qs = {"ps": PAGE_SIZE}
         if fields:
             if not isinstance(fields, str):
                 fields = ",".join(fields)
             qs["f"] = fields.lower()
 
-        page_num = 1
-        page_size = 1
-        n_metrics = 2
-
-        while page_num * page_size < n_metrics:
-            res = self._request("get", "/api/metrics/search", **qs).json()
-            page_num = res["p"]
-            page_size = res["ps"]
-            n_metrics = res["total"]
-
-            qs["p"] = page_num + 1
-
+        for res in self._get_pages("get", "/api/metrics/search", qs):
             for metric in res["metrics"]:
                 yield metric
 
     def get_rules(self, active_only=False, profile=None, languages=None, custom_only=False, f=None):
-        qs = {"is_template": "no", "statuses": "READY"}
+        qs = {"is_template": "no", "statuses": "READY", "ps": PAGE_SIZE}
 
         if profile:
             qs.update({"activation": "true", "qprofile": profile})
@@ -122,24 +187,13 @@ class SQAPIHandler(object):
         if f:
             qs["f"] = f
 
-        page_num = 1
-        page_size = 1
-        n_rules = 2
-        while page_num * page_size < n_rules:
-            res = self._request("post", "/api/rules/search", **qs).json()
-            page_num = res["p"]
-            page_size = res["ps"]
-            n_rules = res["total"]
-            qs["p"] = page_num + 1
-
+        for res in self._get_pages("post", "/api/rules/search", qs):
             for rule in res["rules"]:
                 yield rule
 
     def rules_show(self, key, actives=None):
-        params = {"key": key}
-        if actives is not None:
-            params["actives"] = actives
-        res = self._request("post", "/api/rules/show", **params).json()
+        params = _params(key=key, actives=actives)
+        res = _json(self._request("post", "/api/rules/show", **params))
         return res
 
     def get_resources_debt(self, resource=None, categories=None, include_trends=False, include_modules=False):
@@ -168,7 +222,7 @@ class SQAPIHandler(object):
         if include_modules:
             params["qualifiers"] = "TRK,BRC"
 
-        res = self._request("get", "/api/resources", **params).json()
+        res = _json(self._request("get", "/api/resources", **params))
 
         for prj in res:
             yield prj
@@ -204,7 +258,7 @@ class SQAPIHandler(object):
             params["qualifiers"] = "TRK,BRC"
         params["metrics"] = ",".join(metrics)
 
-        res = self._request("get", "/api/resources", **params).json()
+        res = _json(self._request("get", "/api/resources", **params))
 
         for prj in res:
             yield prj
@@ -227,16 +281,17 @@ class SQAPIHandler(object):
             else:
                 prjs[prj["key"]] = prj
 
-        for _, prj in sorted(prjs.items(), key=operator.itemgetter(0)):
+        # /api/resources does not guarantee key order, so a streaming merge is not possible
+        for prj in sorted(prjs.values(), key=operator.itemgetter("key")):
             yield prj
 
     def validate_authentication(self):
-        res = self._request("get", "/api/authentication/validate").json()
+        res = _json(self._request("get", "/api/authentication/validate"))
         return res.get("valid", False)
 
     def project_create(self, name, project):
         params = {"name": name, "project": project}
-        res = self._request("post", "/api/projects/create", **params).json()
+        res = _json(self._request("post", "/api/projects/create", **params))
         return res
 
     def project_delete(self, project_key):
@@ -245,122 +300,71 @@ class SQAPIHandler(object):
         return res
 
     def get_project(self, projects=None, onProvisionedOnly=None, analyzedBefore=None, qualifiers=None, q=None):
-        params = dict()
-
-        if projects is not None:
-            params["projects"] = projects
-        if onProvisionedOnly is not None:
-            params["onProvisionedOnly"] = onProvisionedOnly
-        if analyzedBefore is not None:
-            params["analyzedBefore"] = analyzedBefore
-        if qualifiers is not None:
-            params["qualifiers"] = qualifiers
-        if q is not None:
-            params["q"] = q
-
-        page_num = 1
-        page_size = 1
-        n_projects = 2
-
-        while page_num * page_size < n_projects:
-            res = self._request("post", "/api/projects/search", **params).json()
-            paging = res["paging"]
-            page_num = paging["pageIndex"]
-            page_size = paging["pageSize"]
-            n_projects = paging["total"]
-
-            params["p"] = page_num + 1
+        params = _params(
+            ps=PAGE_SIZE,
+            projects=projects,
+            onProvisionedOnly=onProvisionedOnly,
+            analyzedBefore=analyzedBefore,
+            qualifiers=qualifiers,
+            q=q,
+        )
 
+        for res in self._get_pages("post", "/api/projects/search", params, paging="paging"):
             for project in res["components"]:
                 yield project
 
     def get_issues(self, languages=None, componentKeys=None, rules=None):
-        params = dict()
-
         if languages:
             if not isinstance(languages, str):
                 languages = ",".join(languages)
-            params["languages"] = languages.lower()
-        if componentKeys is not None:
-            params["componentKeys"] = componentKeys
-        if rules is not None:
-            params["rules"] = rules
-
-        page_num = 1
-        page_size = 1
-        n_issues = 2
-
-        while page_num * page_size < n_issues:
-            res = self._request("post", "/api/issues/search", **params).json()
-            page_num = res["p"]
-            page_size = res["ps"]
-            n_issues = res["total"]
-
-            params["p"] = page_num + 1
+            languages = languages.lower()
+        params = _params(ps=PAGE_SIZE, languages=languages or None, componentKeys=componentKeys, rules=rules)
 
+        for res in self._get_pages("post", "/api/issues/search", params, max_results=ISSUES_MAX_RESULTS):
             for issue in res["issues"]:
                 yield issue
 
     def duplications_show(self, key):
         params = {"key": key}
-        res = self._request("post", "/api/duplications/show", **params).json()
+        res = _json(self._request("post", "/api/duplications/show", **params))
         return res
 
     def ce_task(self, id_, additionalFields=None):
-        params = {"id": id_}
-        if additionalFields is not None:
-            params["additionalFields"] = additionalFields
-        res = self._request("post", "/api/ce/task", **params).json()
+        params = _params(id=id_, additionalFields=additionalFields)
+        res = _json(self._request("post", "/api/ce/task", **params))
         return res
 
     def languages_list(self):
-        res = self._request("get", "/api/languages/list").json()
+        res = _json(self._request("get", "/api/languages/list"))
         return res
 
     def get_system_status(self):
-        res = self._request("get", "/api/system/status").json()
+        res = _json(self._request("get", "/api/system/status"))
         return res
 
     def set_settings(self, key, value=None, values=None, component=None, fieldValues=None):
-        params = {"key": key}
-        if value is not None:
-            params["value"] = value
-        if values is not None:
-            params["values"] = values
-        if component is not None:
-            params["component"] = component
-        if fieldValues is not None:
-            params["fieldValues"] = fieldValues
+        params = _params(key=key, value=value, values=values, component=component, fieldValues=fieldValues)
         res = self._request("post", "/api/settings/set", **params)
         return res
 
     def get_settings(self, keys=None, component=None):
-        params = dict()
-        if keys is not None:
-            params["keys"] = keys
-        if component is not None:
-            params["component"] = component
+        params = _params(keys=keys, component=component)
         res = self._request("get", "/api/settings/values", **params)
         return res
 
     def get_component_measures(self, metricKeys, component, additionalFields=None):
-        params = {"metricKeys": metricKeys, "component": component}
-        if additionalFields is not None:
-            params["additionalFields"] = additionalFields
-        res = self._request("post", "/api/measures/component", **params).json()
+        params = _params(metricKeys=metricKeys, component=component, additionalFields=additionalFields)
+        res = _json(self._request("post", "/api/measures/component", **params))
         return res
 
     def qualityprofiles_search(self, project=None, language=None, qualityProfile=None, defaults=None):
-        params = dict()
-        if project is not None:
-            params["project"] = project
-        if language is not None:
-            params["language"] = language.lower()
-        if qualityProfile is not None:
-            params["qualityProfile"] = qualityProfile
-        if defaults is not None:
-            params["defaults"] = defaults
-        res = self._request("get", "/api/qualityprofiles/search", **params).json()
+        params = _params(
+            project=project,
+            language=language and language.lower(),
+            qualityProfile=qualityProfile,
+            defaults=defaults,
+        )
+        res = _json(self._request("get", "/api/qualityprofiles/search", **params))
         return res
 
     def qualityprofiles_add_project(self, project, language, qualityProfile):
@@ -374,11 +378,7 @@ class SQAPIHandler(object):
         return res
 
     def qualityprofiles_backup(self, language=None, qualityProfile=None):
-        params = dict()
-        if language is not None:
-            params["language"] = language.lower()
-        if qualityProfile is not None:
-            params["qualityProfile"] = qualityProfile
+        params = _params(language=language and language.lower(), qualityProfile=qualityProfile)
         res = self._request("post", "/api/qualityprofiles/backup", **params)
         return res
 
@@ -403,13 +403,9 @@ class SQAPIHandler(object):
         :param qualityProfile:
         :return:
         """
-        params = dict()
-        if exporterKey is not None:
-            params["exporterKey"] = exporterKey
-        if language is not None:
-            params["language"] = language.lower()
-        if qualityProfile is not None:
-            params["qualityProfile"] = qualityProfile
+        params = _params(
+            exporterKey=exporterKey, language=language and language.lower(), qualityProfile=qualityProfile
+        )
         res = self._request("get", "/api/qualityprofiles/export", **params)
         return res
 
@@ -421,7 +417,7 @@ class SQAPIHandler(object):
         :return:
         """
         params = {"name": name, "language": language}
-        res = self._request("post", "/api/qualityprofiles/create", **params).json()
+        res = _json(self._request("post", "/api/qualityprofiles/create", **params))
         return res
 
     def qualityprofiles_delete(self, language=None, qualityProfile=None):
@@ -431,11 +427,7 @@ class SQAPIHandler(object):
         :param qualityProfile:
         :return:
         """
-        params = dict()
-        if language is not None:
-            params["language"] = language.lower()
-        if qualityProfile is not None:
-            params["qualityProfile"] = qualityProfile
+        params = _params(language=language and language.lower(), qualityProfile=qualityProfile)
         res = self._request("post", "/api/qualityprofiles/delete", **params)
         return res
 
@@ -446,23 +438,9 @@ class SQAPIHandler(object):
         :param q: limit search to projects that contain the supplied string.
         :return:
         """
-        params = {"key": key}
-        if q is not None:
-            params["q"] = q
-
-        page_num = 1
-        page_size = 1
-        n_projects = 2
-
-        while page_num * page_size < n_projects:
-            res = self._request("post", "/api/qualityprofiles/projects", **params).json()
-            paging = res["paging"]
-            page_num = paging["pageIndex"]
-            page_size = paging["pageSize"]
-            n_projects = paging["total"]
-
-            params["p"] = page_num + 1
+        params = _params(key=key, ps=PAGE_SIZE, q=q)
 
+        for res in self._get_pages("post", "/api/qualityprofiles/projects", params, paging="paging"):
             for project in res["results"]:
                 yield project
 
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2022 THL A29 Limited
+#
+# This source code file is made available under LGPL License
+# See LICENSE for details
+# ==============================================================================
+
+"""
+JSON helpers, parsing is backed by orjson when it is installed
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data):
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def load(fp):
+    return loads(fp.read())
+
+
+def dumps(obj, indent=None):
+    """
+    Always stdlib json, so written files stay ASCII with \\uXXXX escapes whether orjson is installed or not
+    :param obj:
+    :param indent:
+    :return: str
+    """
+    return json.dumps(obj, indent=indent)
+
+
+def dump(obj, fp, indent=None):
+    fp.write(dumps(obj, indent=indent))
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2022 THL A29 Limited
+#
+# This source code file is made available under LGPL License
+# See LICENSE for details
+# ==============================================================================
+
+"""
+Persistent per-rule cache used by update.py
+"""
+
+import os
+
+import settings
+from util import jsonlib
+
+
+# bump when the cached rule content changes, e.g. another description converter
+CACHE_FORMAT = 1
+
+CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "tca_sonarqube", "rules", f"{settings.VERSION}-{CACHE_FORMAT}"
+)
+
+
+def _cache_path(key):
+    # rule keys look like `csharpsquid:S1234`, ':' is not allowed in windows file names
+    file_name = key.replace(":", "_")
+    return os.path.join(CACHE_DIR, file_name[:2], f"{file_name}.json")
+
+
+def get_or_build(key, rule_hash, builder):
+    """
+    Return the cached rule of key if its rule_hash is unchanged, otherwise build and cache it.
+    :param key: rule key
+    :param rule_hash: hash of the fetched rule, see update.iter_rules
+    :param builder: callable without arguments, returns the rule dict
+    :return: rule dict
+    """
+    path = _cache_path(key)
+    try:
+        with open(path, "rb") as rf:
+            cached = jsonlib.load(rf)
+        if cached.get("rule_hash") == rule_hash:
+            return cached["rule"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    rule = builder()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as wf:
+        jsonlib.dump({"rule_hash": rule_hash, "rule": rule}, wf)
+    os.replace(temp_path, path)
+    return rule
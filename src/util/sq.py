@@ -10,16 +10,20 @@
 import os
 import re
 import sys
-import json
 import shlex
 import getpass
 import psutil
 import platform
 import stat
+import contextlib
+import functools
+import itertools
+import threading
 from shutil import copyfile
 from time import sleep, time
 from subprocess import Popen as p, PIPE as pi, STDOUT as sout
 from threading import Thread as t
+from concurrent.futures import ThreadPoolExecutor
 
 try:
     import xml.etree.cElementTree as ET
@@ -27,6 +31,7 @@ except ImportError:
     import xml.etree.ElementTree as ET
 
 import settings
+from util import jsonlib
 from util.configlib import ConfigReader
 from util.api import SQAPIHandler
 from util.exceptions import CompileTaskError, AnalyzeTaskError, ConfigError, ValidationError, ClientError
@@ -40,6 +45,48 @@ SONAR_DEVCOST = 30
 SONAR_DEBT_RATINGGRID = "0.05,0.1,0.2,0.5"
 
 
+_IS_WIN = sys.platform == "win32"
+_IS_LINUX = sys.platform in ("linux", "linux2")
+_IS_WINDOWS_SYSTEM = platform.system() == "Windows"
+
+
+@functools.lru_cache(maxsize=1)
+def _current_user():
+    # not resolved at import time, getuser raises when the uid has no passwd entry
+    return getpass.getuser()
+
+
+# default of optional lists in SonarQube responses
+_EMPTY = ()
+
+# part of the command line of the SonarQube server process
+SONAR_APPLICATION_LIB = "lib/sonar-application"
+
+
+# SonarQube server log lines meaning the local server can not start
+_SONAR_FATAL_RE = re.compile(
+    "|".join(
+        re.escape(msg)
+        for msg in (
+            "app[][o.s.a.SchedulerImpl] SonarQube is stopped",
+            "错误: 找不到或无法加载主类 org.sonar.application.App",
+            "sudo: pam_open_session: Permission denied",
+            "sudo: pam_open_session：拒绝权限",
+            "java.lang.IllegalStateException: SonarQube requires Java 11 to run",
+            "sudo: sorry, you must have a tty to run sudo",
+            "sudo：抱歉，您必须拥有一个终端来执行 sudo",
+            "org.elasticsearch.cluster.block.ClusterBlockException: blocked by: [FORBIDDEN/12/index read-only / allow delete (api)];",
+            "sudoers.so must be only be writable by owner",
+            "fatal error, unable to load plugins",
+        )
+    )
+)
+
+
+# S3776: "... Cognitive Complexity from 23 to the 15 allowed."
+_S3776_RE = re.compile(r"\b(\d+)\b.*?\b(\d+)\b")
+
+
 LOCAL_MODEL = "LOCAL"
 COMMON_MODEL = "COMMON"
 
@@ -64,6 +111,18 @@ COMMON_SONAR_LANGS = [
 
 
 class SonarQube(object):
+    # environment variables read by the scan commands, they do not change during a task
+    _ENV_KEYS = (
+        "SONAR_BIN",
+        "SONAR_JAVA_SRC",
+        "SONAR_LIB",
+        "SONAR_JAVA_VERSION",
+        "SQ_JAVA_BUILD",
+        "SQ_CLIENT_PARAMS",
+        "SQ_ANALYZE_OPTIONS",
+        "SONAR_SRC",
+    )
+
     def __init__(self, params):
         # admin
         self.base_url = SQ_LOCAL_USER["url"]
@@ -84,17 +143,41 @@ class SonarQube(object):
         self.sleep_second = 5
         self.timeout = 300
         self.com_cmd = list()
+        self._com_cmd_win = list()
+        # only the windows shell needs the -D arguments quoted, resolve the conversion once
+        self._change_to_win_cmd = self._change_to_win_cmd_impl if _IS_WIN else (lambda cmd: cmd)
 
         self.init_env()
+        self._env = {key: os.environ.get(key, "") for key in self._ENV_KEYS}
+        self.property_path = os.path.join(os.environ["SONARQUBE_HOME"], "conf", "sonar.properties")
+        self.property_temp = os.path.join(os.environ["SONARQUBE_HOME"], "conf", "sonar.properties.temp")
 
         self.params = params
+        # O(1) lookups for the issue filter and the profile rules
+        self._rules_set = frozenset(self.params.get("rules") or ())
+        self._rules_params = dict()
+        for rule_info in self.params.get("rule_list") or ():
+            self._rules_params.setdefault(rule_info["name"], rule_info["params"])
         self.work_dir = os.path.join(self.params["task_dir"], "workdir")
-        if not os.path.exists(self.work_dir):
-            os.mkdir(self.work_dir)
+        os.makedirs(self.work_dir, exist_ok=True)
         self.scannerwork = os.path.join(self.work_dir, "scannerwork")
+        self._scannerwork_report = os.path.join(self.scannerwork, "report-task.txt")
+
+        # for example:
+        # SQ_CLIENT_PARAMS="-Dsonar.javascript.globals=;-Dsonar.javascript.environments="
+        sonar_params = self._env["SQ_CLIENT_PARAMS"].strip('"')
+        self._sonar_params = sonar_params.split(";") if sonar_params else []
 
         self.is_local_up = False if settings.PLATFORMS[sys.platform] != "windows" else True
 
+        # failure handlers of run_cmd
+        self._fail_compile = functools.partial(
+            self._raise_error, msg="编译失败，请确认编译命令正确，并查看log排查失败原因。", err_type="compile"
+        )
+        self._fail_analyze = functools.partial(
+            self._raise_error, msg="工具执行分析失败，请查看log排查失败原因。", err_type="analyze"
+        )
+
     def pre_cmd(self, build_cwd):
         pre_cmd = self.params.get("pre_cmd", None)
         if not pre_cmd:
@@ -118,27 +201,27 @@ class SonarQube(object):
         java_home = envs.get("SQ_JDK_HOME")
         build_cwd = envs.get("BUILD_CWD", None)
         build_cwd = os.path.join(source_dir, build_cwd) if build_cwd else source_dir
-        sonarqube_home = envs.get("SONARQUBE_HOME")
-        property_path = os.path.join(sonarqube_home, "conf", "sonar.properties")
-        property_temp = os.path.join(sonarqube_home, "conf", "sonar.properties.temp")
-        is_quality = "SONAR_QUALITYPROFILE" in envs or "SONAR_QUALITYPROFILE_TYPE" in envs
+        devcost_env = envs.get("SONAR_DEVCOST")
+        rating_grid_env = envs.get("SONAR_DEBT_RATINGGRID")
+        is_quality = envs.get("SONAR_QUALITYPROFILE") is not None or envs.get("SONAR_QUALITYPROFILE_TYPE") is not None
 
         if "SONAR_TIMEOUT" in envs:
             self.timeout = int(envs.get("SONAR_TIMEOUT", self.timeout))
 
-        print("[info] User is %s" % str(getpass.getuser()))
+        current_user = _current_user()
+        print("[info] User is %s" % str(current_user))
 
         if "SQ_TYPE" in envs and envs.get("SQ_TYPE") == COMMON_MODEL and SQ_COMMON_USER:
             print("[warning] Link common...")
             self._use_common_sonarqube()
-        elif sys.platform in ("linux", "linux2") and getpass.getuser() == "root":
+        elif _IS_LINUX and current_user == "root":
             self._root_start_local_sonarqube()
         else:
             self._start_local_sonarqube(
                 shlex.split(
                     self.generate_shell_file(
                         f"export PATH={java_home}/bin:$PATH\n./bin/run.sh"
-                        if sys.platform != "win32"
+                        if not _IS_WIN
                         else f"set PATH={java_home}/bin;%PATH%\nbin\\windows-x86-64\\StartSonar.bat"
                     )
                 )
@@ -158,18 +241,18 @@ class SonarQube(object):
 
         self.com_cmd = self._get_common_cmds()
         self._add_sonar_filter_path()
+        # com_cmd is final from here on, convert it for the scanners once
+        self._com_cmd_win = self._change_to_win_cmd(self.com_cmd)
 
         self._wait_until_project_create()
 
-        if envs.get("SONAR_DEVCOST", None):
-            self.sonar_handle.set_settings(
-                key="sonar.technicalDebt.developmentCost", value=int(envs.get("SONAR_DEVCOST", SONAR_DEVCOST))
-            )
+        settings_batch = list()
+        if devcost_env:
+            settings_batch.append({"key": "sonar.technicalDebt.developmentCost", "value": int(devcost_env)})
         # default: 0.05,0.1,0.2,0.5
-        if envs.get("SONAR_DEBT_RATINGGRID", None):
-            self.sonar_handle.set_settings(
-                key="sonar.technicalDebt.ratingGrid", value=envs.get("SONAR_DEBT_RATINGGRID", SONAR_DEBT_RATINGGRID)
-            )
+        if rating_grid_env:
+            settings_batch.append({"key": "sonar.technicalDebt.ratingGrid", "value": rating_grid_env})
+        self._set_settings(settings_batch)
 
         self._set_qualityprofiles(self.sonar_handle, self.projectKey, languages)
 
@@ -178,9 +261,17 @@ class SonarQube(object):
             sonar_report = os.path.join(source_dir, envs.get("SONAR_REPORT"))
         if not sonar_report or not os.path.exists(sonar_report):
             print(f"{sonar_report}结果文件不存在，开始遍历查找SQ分析结果文件...")
-            sonar_report_list = self.get_dir_files(source_dir, "report-task.txt".lower())
-            if self.scannerwork and os.path.exists(self.scannerwork):
-                sonar_report_list.extend(self.get_dir_files(self.scannerwork, "report-task.txt".lower()))
+            # the two trees are independent, walk them at the same time
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                source_reports = executor.submit(self.get_dir_files, source_dir, "report-task.txt")
+                scannerwork_reports = (
+                    executor.submit(self.get_dir_files, self.scannerwork, "report-task.txt")
+                    if self.scannerwork and os.path.exists(self.scannerwork)
+                    else None
+                )
+                sonar_report_list = source_reports.result()
+                if scannerwork_reports:
+                    sonar_report_list.extend(scannerwork_reports.result())
             if sonar_report_list:
                 sonar_report = sonar_report_list[0]
                 print(f"查找到分析文件{sonar_report}")
@@ -191,15 +282,15 @@ class SonarQube(object):
         self._dump_measures(self.sonar_handle, self.projectKey, os.path.join(work_dir, "sonar_result.json"))
 
         issues = []
+        rules_set = self._rules_set if not is_quality else None
         try:
             for issue in self.sonar_handle.get_issues(
                 languages=languages, componentKeys=self.projectKey, rules=None if is_quality else ",".join(rules)
             ):
                 rule = issue["rule"]
-                if not is_quality and rules and rule not in rules:
+                if rules_set and rule not in rules_set:
                     continue
-                path = issue["component"].split(":")[-1]
-                path = os.path.join(build_cwd, path)[pos:]
+                path = os.path.join(build_cwd, issue["component"].rpartition(":")[2])[pos:]
                 msg = issue["message"]
                 text_range = issue.get("textRange", None)
                 if text_range:
@@ -227,18 +318,17 @@ class SonarQube(object):
                             {"path": path, "rule": rule, "msg": msg, "line": line, "column": column, "refs": refs}
                         )
                 else:
-                    refs = list()
-                    for flow in issue.get("flows", []):
-                        for location in flow.get("locations", []):
-                            refs.append(
-                                {
-                                    "line": location["textRange"]["startLine"],
-                                    "column": location["textRange"]["startOffset"],
-                                    "msg": location.get("msg", ""),
-                                    "tag": None,
-                                    "path": location["component"].split(":")[-1],
-                                }
-                            )
+                    refs = [
+                        {
+                            "line": location["textRange"]["startLine"],
+                            "column": location["textRange"]["startOffset"],
+                            "msg": location.get("msg", ""),
+                            "tag": None,
+                            "path": location["component"].rpartition(":")[2],
+                        }
+                        for flow in issue.get("flows", _EMPTY)
+                        for location in flow.get("locations", _EMPTY)
+                    ]
                     issues.append(
                         {"path": path, "rule": rule, "msg": msg, "line": line, "column": column, "refs": refs}
                     )
@@ -250,16 +340,17 @@ class SonarQube(object):
             cogn_complex_cnt = 0
             cogn_complex_sum = 0
             cogn_complex_over = 0
+            search = _S3776_RE.search
             for issue in issues:
                 if not issue["rule"].endswith(":S3776"):
                     continue
-                msg = issue["msg"]
-                info = [token for token in msg.split() if token.isdigit()]
-                if len(info) < 2:
+                match = search(issue["msg"])
+                if not match:
                     continue
+                complexity = int(match.group(1))
                 cogn_complex_cnt += 1
-                cogn_complex_sum += int(info[0])
-                cogn_complex_over += int(info[0]) - int(info[1])
+                cogn_complex_sum += complexity
+                cogn_complex_over += complexity - int(match.group(2))
             if "summary" not in self.params:
                 self.params["summary"] = dict()
             self.params["summary"]["cogncomplexity"] = {
@@ -268,33 +359,47 @@ class SonarQube(object):
                 "over_cognc_sum": cogn_complex_over,
             }
 
-        if envs.get("SONAR_DEVCOST", None):
-            self.sonar_handle.set_settings(key="sonar.technicalDebt.developmentCost", value=SONAR_DEVCOST)
-        if envs.get("SONAR_DEBT_RATINGGRID", None):
-            self.sonar_handle.set_settings(key="sonar.technicalDebt.ratingGrid", value=SONAR_DEBT_RATINGGRID)
+        settings_batch = list()
+        if devcost_env:
+            settings_batch.append({"key": "sonar.technicalDebt.developmentCost", "value": SONAR_DEVCOST})
+        if rating_grid_env:
+            settings_batch.append({"key": "sonar.technicalDebt.ratingGrid", "value": SONAR_DEBT_RATINGGRID})
+        self._set_settings(settings_batch)
 
         print("[warning] Operation after ")
         if self.model == LOCAL_MODEL:
             self._kill_sonar()
 
             if "SONAR_SERVER_PARAMS" in envs:
-                os.remove(property_path)
-                os.rename(property_temp, property_path)
+                os.remove(self.property_path)
+                os.rename(self.property_temp, self.property_path)
 
         return issues
 
+    def _set_settings(self, settings_batch):
+        """
+        Send independent set_settings calls concurrently
+        :param settings_batch: list of set_settings kwargs
+        :return:
+        """
+        if not settings_batch:
+            return
+        with ThreadPoolExecutor(max_workers=len(settings_batch)) as executor:
+            list(executor.map(lambda kwargs: self.sonar_handle.set_settings(**kwargs), settings_batch))
+
     @staticmethod
     def init_env():
         tool_dir = settings.TOOL_DIR
-        os.environ["SONAR_SCANNER_HOME"] = os.path.join(
-            tool_dir, settings.PLATFORMS[sys.platform], "sonar-scanner-4.2.0.1873"
-        )
-        os.environ["SQ_JDK_HOME"] = os.path.join(os.environ["SONAR_SCANNER_HOME"], "jre")
+        plat = settings.PLATFORMS[sys.platform]
+        scanner_home = os.path.join(tool_dir, plat, "sonar-scanner-4.2.0.1873")
+        jdk_home = os.path.join(scanner_home, "jre")
+        os.environ["SONAR_SCANNER_HOME"] = scanner_home
+        os.environ["SQ_JDK_HOME"] = jdk_home
         os.environ["SONARQUBE_HOME"] = os.path.join(tool_dir, "common", "sonarqube-8.9.8.54436")
         os.environ["PATH"] = os.pathsep.join(
             [
-                os.path.join(os.environ["SQ_JDK_HOME"], "bin"),
-                os.path.join(os.environ["SONAR_SCANNER_HOME"], "bin"),
+                os.path.join(jdk_home, "bin"),
+                os.path.join(scanner_home, "bin"),
                 os.environ["PATH"],
             ]
         )
@@ -302,21 +407,18 @@ class SonarQube(object):
     def kill_proc_famliy(self, pid):
         try:
             task_proc = psutil.Process(pid)
-            children = task_proc.children(recursive=True)
-            print("[info] kill process: %s" % task_proc)
-            task_proc.terminate()
-            print("[info] kill children processes: %s" % children)
-            for child in children:
-                try:
-                    child.kill()
-                except Exception as err:
-                    print("[error] kill child proc failed: %s" % err)
-            gone, still_alive = psutil.wait_procs(children, timeout=5)
-            for child in still_alive:
-                try:
-                    child.kill()
-                except Exception as err:
-                    print("[error] kill child proc failed: %s" % err)
+            procs = [task_proc] + task_proc.children(recursive=True)
+            print("[info] terminate processes: %s" % procs)
+            for proc in procs:
+                with contextlib.suppress(psutil.NoSuchProcess):
+                    proc.terminate()
+            gone, still_alive = psutil.wait_procs(procs, timeout=5)
+            if still_alive:
+                print("[info] kill processes still alive: %s" % still_alive)
+                for proc in still_alive:
+                    with contextlib.suppress(psutil.NoSuchProcess):
+                        proc.kill()
+                psutil.wait_procs(still_alive, timeout=2)
         except psutil.NoSuchProcess as err:
             print("[warning] process is already terminated: %s" % err)
         except Exception as err:
@@ -350,19 +452,30 @@ class SonarQube(object):
         return result
 
     def get_dir_files(self, root_dir, want_suffix=""):
-        files = set()
-        for dirpath, _, filenames in os.walk(root_dir):
-            for f in filenames:
-                if f.lower().endswith(want_suffix):
-                    fullpath = os.path.join(dirpath, f)
-                    files.add(fullpath)
-        files = list(files)
-        return files
+        """
+        Files under root_dir whose name ends with want_suffix, case insensitive.
+        """
+        return list(self._iter_dir_files(root_dir, want_suffix.lower()))
+
+    @staticmethod
+    def _iter_dir_files(root_dir, want_suffix):
+        dirs = [root_dir]
+        while dirs:
+            try:
+                entries = os.scandir(dirs.pop())
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.path)
+                    elif entry.is_file() and entry.name.lower().endswith(want_suffix):
+                        yield entry.path
 
     @staticmethod
     def generate_shell_file(cmd, shell_name="build"):
         work_dir = os.getcwd()
-        if platform.system() == "Windows":
+        if _IS_WINDOWS_SYSTEM:
             file_name = f"{shell_name}.bat"
         else:
             file_name = f"{shell_name}.sh"
@@ -375,7 +488,7 @@ class SonarQube(object):
         print("[info] Cmd:\n%s" % cmd)
         print("[info] Generated shell file: %s" % shell_filepath)
 
-        if platform.system() == "Windows":
+        if _IS_WINDOWS_SYSTEM:
             return shell_filepath
         else:
             return "bash %s" % shell_filepath
@@ -390,17 +503,32 @@ class SonarQube(object):
         return line
 
     class Process(object):
-        def __init__(self, command, cwd=None, out=None):
+        def __init__(self, command, cwd=None, out=None, raw=False):
+            """
+            :param command:
+            :param cwd:
+            :param out: called with every non-empty output line
+            :param raw: pass the lines to out as bytes instead of decoding them
+            """
             self.p = p(command, cwd=cwd, stdout=pi, stderr=sout)
             self.out = out
             if self.out:
+                convert = bytes if raw else SonarQube.decode
+
                 def do():
-                    while self.p.poll() is None:
-                        out = self.p.stdout.readline()
-                        out = SonarQube.decode(out.strip())
-                        if out:
-                            self.out(out)
-                    out = SonarQube.decode(self.p.stdout.read())
+                    # read whatever is available and split lines here, EOF means the process closed its output
+                    buf = b""
+                    while True:
+                        chunk = self.p.stdout.read1(65536)
+                        if not chunk:
+                            break
+                        lines = (buf + chunk).split(b"\n")
+                        buf = lines.pop()
+                        for line in lines:
+                            out = convert(line.strip())
+                            if out:
+                                self.out(out)
+                    out = convert(buf.strip())
                     if out:
                         self.out(out)
                 out_t = t(target=do)
@@ -441,14 +569,12 @@ class SonarQube(object):
                 ["useradd", user],
                 cwd=sonarqube_home,
             ).wait()
-        SonarQube.Process(
-            ["chmod", "-R", "777", sonarqube_home],
-            cwd=sonarqube_home,
-        ).wait()
-        SonarQube.Process(
-            ["chmod", "-R", "777", java_home],
-            cwd=sonarqube_home,
-        ).wait()
+        # the two trees are disjoint, chmod them in parallel
+        chmod_procs = [
+            SonarQube.Process(["chmod", "-R", "777", path], cwd=sonarqube_home) for path in (sonarqube_home, java_home)
+        ]
+        for chmod_proc in chmod_procs:
+            chmod_proc.wait()
         self._chmod_ancestor_dir(sonarqube_home, 0o777)
 
         return self._start_local_sonarqube(
@@ -460,18 +586,14 @@ class SonarQube(object):
 
         envs = os.environ
         sonarqube_home = envs.get("SONARQUBE_HOME")
-        property_path = os.path.join(sonarqube_home, "conf", "sonar.properties")
-        property_temp = os.path.join(sonarqube_home, "conf", "sonar.properties.temp")
 
         if "SONAR_SERVER_PARAMS" in envs:
-            if not os.path.exists(property_temp):
-                copyfile(property_path, property_temp)
+            if not os.path.exists(self.property_temp):
+                copyfile(self.property_path, self.property_temp)
             # default: SONAR_SERVER_PARAMS=sonar.web.javaOpts=-Xmx512m -Xms128m;sonar.ce.javaOpts=-Xmx512m -Xms128m
             sonar_server_params = envs.get("SONAR_SERVER_PARAMS").strip('"').split(";")
-            f = open(property_path, "a")
-            for param in sonar_server_params:
-                f.write("\n%s" % param)
-            f.close()
+            with open(self.property_path, "a") as f:
+                f.write("\n" + "\n".join(sonar_server_params))
 
         print("[info] cmd: %s" % " ".join(cmd))
         p = SonarQube.Process(
@@ -493,41 +615,40 @@ class SonarQube(object):
         :return:
         """
         print(f"SQServer: {line}")
-        if (
-            line.find("app[][o.s.a.SchedulerImpl] SonarQube is stopped") != -1
-            or line.find("错误: 找不到或无法加载主类 org.sonar.application.App") != -1
-            or line.find("sudo: pam_open_session: Permission denied") != -1
-            or line.find("sudo: pam_open_session：拒绝权限") != -1
-            or line.find("java.lang.IllegalStateException: SonarQube requires Java 11 to run") != -1
-            or line.find("sudo: sorry, you must have a tty to run sudo") != -1
-            or line.find("sudo：抱歉，您必须拥有一个终端来执行 sudo") != -1
-            or line.find(
-                "org.elasticsearch.cluster.block.ClusterBlockException: blocked by: [FORBIDDEN/12/index read-only / allow delete (api)];"
-            )
-            != -1
-            or line.find("sudoers.so must be only be writable by owner") != -1
-            or line.find("fatal error, unable to load plugins") != -1
-        ):
+        if _SONAR_FATAL_RE.search(line):
             if SQ_COMMON_USER:
                 print("[warning] Change to common...")
                 self._use_common_sonarqube()
-        elif line.find("SonarQube is up") != -1:
+        elif "SonarQube is up" in line:
             print("[warning] Linking Server.")
             self.is_local_up = True
 
+    def _backoff(self):
+        """
+        Poll intervals, starting at 0.25s and growing up to sleep_second
+        """
+        delay = 0.25
+        while True:
+            yield delay
+            delay = min(delay * 1.6, self.sleep_second)
+
     def _wait_until_task_succeed(self, sonar_handle, sonar_report):
         if not sonar_report or not os.path.exists(sonar_report):
             self._raise_error(f"结果文件({sonar_report})不存在，分析失败，请查看log排查失败原因", err_type="analyze")
         with open(sonar_report) as f:
-            id = f.readlines()[4].strip().split("=")[-1]
-            print("[warning] Task ID is %s" % id)
+            # ceTaskId is on the 5th line
+            lines = list(itertools.islice(f, 5))
+        if len(lines) < 5:
+            self._raise_error(f"结果文件({sonar_report})内容不完整，分析失败，请查看log排查失败原因", err_type="analyze")
+        task_id = lines[4].strip().rpartition("=")[2]
+        print("[warning] Task ID is %s" % task_id)
         timeout = time() + self.timeout
         is_success = False
+        backoff = self._backoff()
         while not is_success:
             res = None
             try:
-                sleep(self.sleep_second)
-                res = sonar_handle.ce_task(id_=id)
+                res = sonar_handle.ce_task(id_=task_id)
                 print("[info] Server response is %s" % str(res))
                 is_success = True if res["task"]["status"] == "SUCCESS" else False
             except Exception as e:
@@ -553,15 +674,17 @@ class SonarQube(object):
 
             if timeout < time():
                 self._raise_error("判断任务执行是否执行完成操作超时，请查看log排查原因", err_type="analyze")
+            if not is_success:
+                sleep(next(backoff))
         print("[warning] Task completed.")
 
     def _wait_until_sonarqube_on(self):
         timeout = time() + self.timeout
         is_server_up = False
+        backoff = self._backoff()
         print("[warning] Wait for Server...")
         while not is_server_up or not self.is_local_up:
             try:
-                sleep(self.sleep_second)
                 print(f"Checking {self.model} Status...")
                 status = self.sonar_handle.get_system_status().get("status", "DOWN")
                 print("[info] Status is %s" % str(status)[0])
@@ -571,6 +694,8 @@ class SonarQube(object):
 
             if timeout < time():
                 self._raise_error("等待Sq工具启动超时，请查看log排查原因", err_type="analyze")
+            if not is_server_up or not self.is_local_up:
+                sleep(next(backoff))
         print("[warning] Server is %s" % str(is_server_up))
         print("[warning] Own is %s" % str(self.is_local_up))
         print("[warning] Linking Server.")
@@ -621,14 +746,12 @@ class SonarQube(object):
         self.params["summary"]["sqdebt"] = measures_result
 
         print("[info] SQ result is %s" % str(measures_result))
-        with open(dump_path, "w") as f:
-            json.dump(measures_result, f, indent=2)
+        with open(dump_path, "w", encoding="utf-8") as f:
+            jsonlib.dump(measures_result, f, indent=2)
 
     def _set_qualityprofiles(self, sonar_handle, project_key, languages):
         source_dir = os.environ.get("SOURCE_DIR", None)
         work_dir = self.work_dir
-        rules = self.params["rules"]
-        rule_list = self.params.get("rule_list", [])
         envs = os.environ
         langs = languages.split(",")
 
@@ -636,9 +759,10 @@ class SonarQube(object):
             os.path.join(os.path.dirname(settings.TOOL_DIR), "profiles"), "_SonarQube_Profile.xml".lower()
         )
         qualityprofile_filepaths = dict()
+        # profile path -> {"lang": ..., "name": ...}, so every profile is parsed only once
+        profile_infos = dict()
         profiles_path = os.path.join(work_dir, "profiles")
-        if not os.path.exists(profiles_path):
-            os.mkdir(profiles_path)
+        os.makedirs(profiles_path, exist_ok=True)
 
         for profile in default_profiles:
             profile_name = os.path.basename(profile)
@@ -646,26 +770,30 @@ class SonarQube(object):
             if self.model in (LOCAL_MODEL, COMMON_MODEL) and lang not in COMMON_SONAR_LANGS:
                 continue
             profile_path = os.path.join(profiles_path, profile_name)
-            copyfile(profile, profile_path)
+            self._copy_profile(profile, profile_path)
             qualityprofile_filepaths[lang] = profile_path
 
-        if "SONAR_QUALITYPROFILE_TYPE" in envs:
-            print(f"启用{envs.get('SONAR_QUALITYPROFILE_TYPE', '')}模式配置文件")
+        quality_type_env = envs.get("SONAR_QUALITYPROFILE_TYPE")
+        quality_env = envs.get("SONAR_QUALITYPROFILE")
+
+        if quality_type_env is not None:
+            print(f"启用{quality_type_env}模式配置文件")
             for path in self.get_dir_files(
                 os.path.join(os.path.dirname(settings.TOOL_DIR), "profiles"),
-                f"_{envs.get('SONAR_QUALITYPROFILE_TYPE', '')}.xml".lower(),
+                f"_{quality_type_env}.xml".lower(),
             ):
                 info = self._get_profile_info(path)
                 if info["lang"] not in langs:
                     continue
                 profile_name = os.path.basename(path)
                 profile_path = os.path.join(profiles_path, profile_name)
-                copyfile(path, profile_path)
+                self._copy_profile(path, profile_path)
                 qualityprofile_filepaths[info["lang"]] = profile_path
+                profile_infos[profile_path] = info
 
-        if envs.get("SONAR_QUALITYPROFILE", None):
+        if quality_env:
             print("[warning] 使用项目指定质量配置文件")
-            for path in str(envs.get("SONAR_QUALITYPROFILE")).split(";"):
+            for path in quality_env.split(";"):
                 profile_path = os.path.join(source_dir, path)
                 if not os.path.exists(profile_path):
                     self._raise_error(f"自主设置的配置文件({path})不存在, 请自查，填写正确的配置文件路径。", err_type="config")
@@ -673,25 +801,23 @@ class SonarQube(object):
                 if info["lang"] not in langs:
                     continue
                 qualityprofile_filepaths[info["lang"]] = profile_path
+                profile_infos[profile_path] = info
 
         for lang in qualityprofile_filepaths:
             profile_path = qualityprofile_filepaths[lang]
             if not profile_path.lower().endswith("_SonarQube_Profile.xml".lower()):
                 continue
-            tree = ET.ElementTree(file=profile_path)
+            tree = ET.parse(profile_path)
             root = tree.getroot()
+            profile_infos[profile_path] = self._get_root_info(root)
             all_rules = root.find("rules")
-            removed_rules = list()
+            kept_rules = list()
             for rule in all_rules:
                 real_name = "%s:%s" % (rule.find("repositoryKey").text, rule.find("key").text)
-                if real_name not in rules:
-                    removed_rules.append(rule)
+                if real_name not in self._rules_set:
                     continue
-                rule_param = None
-                for rule_info in rule_list:
-                    if rule_info["name"] == real_name:
-                        rule_param = rule_info["params"]
-                        break
+                kept_rules.append(rule)
+                rule_param = self._rules_params.get(real_name)
                 if not rule_param:
                     continue
                 if "[sq]" not in rule_param:
@@ -706,160 +832,221 @@ class SonarQube(object):
                     if key.text in rule_params_dict:
                         value.text = rule_params_dict[key.text]
 
-            for rule in removed_rules:
-                all_rules.remove(rule)
+            all_rules[:] = kept_rules
             tree.write(profile_path)
 
-        for lang in qualityprofile_filepaths:
-            path = qualityprofile_filepaths[lang]
-            sonar_handle.qualityprofiles_restore(path)
-            info = self._get_profile_info(path)
-            sonar_handle.qualityprofiles_add_project(
+        # requests.Session is not guaranteed to be thread safe, every worker thread gets a handler of its own
+        thread_handles = threading.local()
+
+        def install_profile(path):
+            handle = getattr(thread_handles, "handle", None)
+            if handle is None:
+                handle = thread_handles.handle = sonar_handle.clone()
+            handle.qualityprofiles_restore(path)
+            info = profile_infos.get(path) or self._get_profile_info(path)
+            handle.qualityprofiles_add_project(
                 project=project_key, language=info["lang"], qualityProfile=info["name"]
             )
 
+        if not qualityprofile_filepaths:
+            return
+        # profiles of different languages are independent
+        with ThreadPoolExecutor(max_workers=min(8, len(qualityprofile_filepaths))) as executor:
+            # consuming the results re-raises the first failure
+            list(executor.map(install_profile, qualityprofile_filepaths.values()))
+
+    @staticmethod
+    def _copy_profile(src, dst):
+        # the copy takes over the mtime of src, so a copy left untouched by an earlier scan has the same size and
+        # mtime as src, while a filtered copy has been rewritten and gets copied again
+        # only the mtime is carried over, the permission bits of a read-only tools dir would block the rewrite
+        src_stat = os.stat(src)
+        try:
+            dst_stat = os.stat(dst)
+            if src_stat.st_size == dst_stat.st_size and src_stat.st_mtime_ns == dst_stat.st_mtime_ns:
+                return
+        except FileNotFoundError:
+            pass
+        copyfile(src, dst)
+        os.utime(dst, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+
     def _get_profile_info(self, path):
-        tree = ET.ElementTree(file=path)
-        children = tree.getroot().getchildren()
-        return {"lang": children[1].text, "name": children[0].text}
+        # name and language are the first two children of the root, stop before parsing the rules
+        texts = list()
+        depth = 0
+        for event, elem in ET.iterparse(path, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1:
+                texts.append(elem.text)
+                if len(texts) == 2:
+                    break
+        return {"lang": texts[1], "name": texts[0]}
+
+    @staticmethod
+    def _get_root_info(root):
+        # <profile><name/><language/>...
+        return {"lang": root[1].text, "name": root[0].text}
 
     def _kill_sonar(self):
-        pids = psutil.pids()
-        for pid in pids:
+        for proc in psutil.process_iter(attrs=["name", "cmdline"]):
             try:
-                p = psutil.Process(pid)
-                if p.name().lower().startswith("java") and " ".join(p.cmdline()).find("lib/sonar-application") != -1:
-                    self.kill_proc_famliy(pid)
+                info = proc.info
+                if not (info["name"] or "").lower().startswith("java"):
+                    continue
+                if SONAR_APPLICATION_LIB in " ".join(info["cmdline"] or ()):
+                    self.kill_proc_famliy(proc.pid)
                     break
             except Exception as e:
                 print("[info] exception: %s" % str(e))
 
     def _get_common_cmds(self):
-        cmds = [
-            "-Dsonar.projectKey=%s" % self.projectKey,
-            "-Dsonar.host.url=%s:%s%s" % (self.base_url, str(self.port), self.base_path),
-            "-Dsonar.login=%s" % self.user,
-            "-Dsonar.password=%s" % self.password,
+        # built after the server is up, _use_common_sonarqube may have switched the server and project key
+        return [
+            f"-Dsonar.projectKey={self.projectKey}",
+            f"-Dsonar.host.url={self.base_url}:{self.port}{self.base_path}",
+            f"-Dsonar.login={self.user}",
+            f"-Dsonar.password={self.password}",
             "-Dsonar.scm.disabled=true",
             "-Dsonar.import_unknown_files=true",
             "-Dsonar.sourceEncoding=UTF-8",
-            "-Dsonar.working.directory=%s" % self.scannerwork,
+            f"-Dsonar.working.directory={self.scannerwork}",
+            *self._sonar_params,
         ]
 
-        # for example:
-        # SQ_CLIENT_PARAMS="-Dsonar.javascript.globals=;-Dsonar.javascript.environments="
-        if "SQ_CLIENT_PARAMS" in os.environ:
-            sonar_params = os.environ.get("SQ_CLIENT_PARAMS", "")
-            sonar_params = sonar_params.strip('"').split(";") if sonar_params else []
-            cmds.extend(sonar_params)
-
-        return cmds
-
-    def change_to_vs_cmd(self, cmd):
-        result = list()
-        for c in cmd:
-            if c.startswith("-Dsonar.projectKey="):
-                result.append(f'/k:"{c.split("=")[1]}"')
-            elif c.startswith("-D"):
-                token = c.split("=")
-                result.append(f'/d:{token[0][2:]}="{token[1]}"')
-            else:
-                result.append(c)
-        return result
-
-    def _change_to_win_cmd(self, cmd):
-        if sys.platform != "win32":
-            return cmd
-        result = list()
-        for c in cmd:
-            if c.startswith("-D"):
-                result.append('-D"' + c[2:] + '"')
-            else:
-                result.append(c)
-        return result
-
-    def run_cmd(self, command, cwd=None, cmd_type=None):
+    @staticmethod
+    def _to_vs_arg(c):
+        """
+        :param c: argument of sonar-scanner
+        :return: the argument as SonarScanner.MSBuild takes it
+        """
+        if not c.startswith("-D"):
+            return c
+        # sonar-scanner reads a bare -Dkey as key=true
+        key, sep, value = c.partition("=")
+        if not sep:
+            value = "true"
+        if key == "-Dsonar.projectKey":
+            return f'/k:"{value}"'
+        return f'/d:{key[2:]}="{value}"'
+
+    def _change_to_win_cmd_impl(self, cmd):
+        return ['-D"' + c[2:] + '"' if c.startswith("-D") else c for c in cmd]
+
+    def run_cmd(self, command, cwd=None, on_fail=None):
+        """
+        :param command:
+        :param cwd:
+        :param on_fail: called when the command exits with non-zero, e.g. self._fail_compile
+        :return:
+        """
         # print("[warning] run cmd: %s" % " ".join(command))
         print("[warning] Start cmd...")
+        # the output is written to the binary stdout below, flush what is still in the text layer first
+        sys.stdout.flush()
         p = SonarQube.Process(
             command,
             cwd,
             self.__handle,
+            raw=True,
         )
         p.wait()
-        if p.p.returncode != 0:
-            if cmd_type == "compile":
-                self._raise_error(msg="编译失败，请确认编译命令正确，并查看log排查失败原因。", err_type=cmd_type)
-            elif cmd_type == "analyze":
-                self._raise_error(msg="工具执行分析失败，请查看log排查失败原因。", err_type=cmd_type)
+        if p.p.returncode != 0 and on_fail:
+            on_fail()
 
     def __handle(self, line):
-        print(line)
-        if line.find("java.lang.IllegalStateException: No files nor directories matching") != -1:
+        """
+        :param line: output line of the scanner, bytes, only decoded when it reports an error
+        :return:
+        """
+        sys.stdout.buffer.write(line + b"\n")
+        # nearly every line is plain output, rule it out with a single search
+        if b"java.lang.IllegalStateException: " not in line:
+            return
+        if b"java.lang.IllegalStateException: No files nor directories matching" in line:
             self._raise_error(msg="Tool_BIN指定的路径下没有找到class文件，请确认Tool_BIN设置正确。", err_type="analyze")
-        elif line.find("java.lang.IllegalStateException: Unable to read file") != -1:
-            self._raise_error(msg=f"解析该文件失败，请确保该文件是不是软链接、编码或者语法有问题: {line}", err_type="config")
+        elif b"java.lang.IllegalStateException: Unable to read file" in line:
+            self._raise_error(
+                msg=f"解析该文件失败，请确保该文件是不是软链接、编码或者语法有问题: {self.decode(line)}", err_type="config"
+            )
 
     def scan_java_proj(self, build_type, build_cwd, build_cmd=None):
-        if build_type.lower() in ("any", "no_build"):
-            if os.environ.get("SQ_JAVA_BUILD") and build_cmd:
-                self.run_cmd(command=shlex.split(build_cmd), cwd=build_cwd)
-            scan_cmd = [
-                "sonar-scanner",
-                "-X",
-                "-Dsonar.sources=%s" % os.environ.get("SONAR_JAVA_SRC", "."),
-                "-Dsonar.language=java,jsp",
-                "-Dsonar.java.binaries=%s" % os.environ.get("SONAR_BIN", "**/*"),
-            ] + self.com_cmd
-            if os.environ.get("SONAR_LIB", None):
-                scan_cmd.append("-Dsonar.java.libraries=%s" % os.environ.get("SONAR_LIB"))
-            if os.environ.get("SONAR_JAVA_VERSION", None):
-                scan_cmd.append("-Dsonar.java.source=%s" % os.environ.get("SONAR_JAVA_VERSION"))
-            scan_cmd = self._change_to_win_cmd(scan_cmd)
-            self.run_cmd(command=scan_cmd, cwd=build_cwd, cmd_type="analyze")
-
-            if self.scannerwork and os.path.exists(self.scannerwork):
-                return os.path.join(self.scannerwork, "report-task.txt")
-            return os.path.join(build_cwd, ".scannerwork", "report-task.txt")
-
-        elif build_type.lower() in ("gradle",):
-            if not build_cmd:
-                self._raise_error(msg="SQ工具执行Java静态分析时候需要输入编译命令，请填入编译命令后重试。", err_type="compile")
-            self.run_cmd(
-                command=self._change_to_win_cmd(shlex.split(build_cmd) + ["sonarqube"] + self.com_cmd),
-                cwd=build_cwd,
-                cmd_type="compile",
+        scan_fun = self._JAVA_BUILD_SCANS.get(build_type.lower())
+        if not scan_fun:
+            self._raise_error(
+                "设置SONAR_BUILD_TYPE异常: 当前SQJava仅支持设置SONAR_BUILD_TYPE为no_build、gradle、maven或ant模式，请检查是否设置错误。",
+                err_type="config",
+            )
+        return scan_fun(self, build_cwd, build_cmd)
+
+    def _scan_java_no_build(self, build_cwd, build_cmd):
+        env = self._env
+        to_win_cmd = self._change_to_win_cmd
+        if env["SQ_JAVA_BUILD"] and build_cmd:
+            self.run_cmd(command=shlex.split(build_cmd), cwd=build_cwd)
+        scan_cmd = (
+            to_win_cmd(
+                [
+                    "sonar-scanner",
+                    "-X",
+                    "-Dsonar.sources=%s" % (env["SONAR_JAVA_SRC"] or "."),
+                    "-Dsonar.language=java,jsp",
+                    "-Dsonar.java.binaries=%s" % (env["SONAR_BIN"] or "**/*"),
+                ]
             )
+            + self._com_cmd_win
+        )
+        java_cmd = list()
+        if env["SONAR_LIB"]:
+            java_cmd.append("-Dsonar.java.libraries=%s" % env["SONAR_LIB"])
+        if env["SONAR_JAVA_VERSION"]:
+            java_cmd.append("-Dsonar.java.source=%s" % env["SONAR_JAVA_VERSION"])
+        scan_cmd.extend(to_win_cmd(java_cmd))
+        self.run_cmd(command=scan_cmd, cwd=build_cwd, on_fail=self._fail_analyze)
 
-            if self.scannerwork and os.path.exists(self.scannerwork):
-                return os.path.join(self.scannerwork, "report-task.txt")
-            return os.path.join(build_cwd, "build", "sonar", "report-task.txt")
+        return self._report_task_path(build_cwd, ".scannerwork")
 
-        elif build_type.lower() in ("maven", "mvn"):
-            compile_cmd = list()
-            if build_cmd:
-                compile_cmd = shlex.split(build_cmd)
-            else:
-                print("[warning] 没有检测到编译命令，尝试使用默认编译命令。")
-                compile_cmd = ["mvn"]
-            compile_cmd.extend(["sonar:sonar", "-Dsonar.java.binaries=%s" % os.environ.get("SONAR_BIN", "**/*")])
-            compile_cmd.extend(self.com_cmd)
-            self.run_cmd(command=self._change_to_win_cmd(compile_cmd), cwd=build_cwd, cmd_type="compile")
-
-        elif build_type.lower() in ("ant",):
-            if not build_cmd:
-                self._raise_error(msg="SQ工具执行Java静态分析时候需要输入编译命令，请填入编译命令后重试。", err_type="compile")
-            self.run_cmd(
-                command=self._change_to_win_cmd(["ant", "sonar", "-v"] + self.com_cmd),
-                cwd=build_cwd,
-                cmd_type="compile",
-            )
+    def _scan_java_gradle(self, build_cwd, build_cmd):
+        if not build_cmd:
+            self._raise_error(msg="SQ工具执行Java静态分析时候需要输入编译命令，请填入编译命令后重试。", err_type="compile")
+        self.run_cmd(
+            command=self._change_to_win_cmd(shlex.split(build_cmd) + ["sonarqube"]) + self._com_cmd_win,
+            cwd=build_cwd,
+            on_fail=self._fail_compile,
+        )
 
+        return self._report_task_path(build_cwd, "build", "sonar")
+
+    def _scan_java_maven(self, build_cwd, build_cmd):
+        if build_cmd:
+            compile_cmd = shlex.split(build_cmd)
         else:
-            self._raise_error(
-                "设置SONAR_BUILD_TYPE异常: 当前SQJava仅支持设置SONAR_BUILD_TYPE为no_build、gradle、maven或ant模式，请检查是否设置错误。",
-                err_type="config",
-            )
+            print("[warning] 没有检测到编译命令，尝试使用默认编译命令。")
+            compile_cmd = ["mvn"]
+        compile_cmd.extend(["sonar:sonar", "-Dsonar.java.binaries=%s" % (self._env["SONAR_BIN"] or "**/*")])
+        compile_cmd = self._change_to_win_cmd(compile_cmd) + self._com_cmd_win
+        self.run_cmd(command=compile_cmd, cwd=build_cwd, on_fail=self._fail_compile)
+
+    def _scan_java_ant(self, build_cwd, build_cmd):
+        if not build_cmd:
+            self._raise_error(msg="SQ工具执行Java静态分析时候需要输入编译命令，请填入编译命令后重试。", err_type="compile")
+        self.run_cmd(
+            command=["ant", "sonar", "-v"] + self._com_cmd_win,
+            cwd=build_cwd,
+            on_fail=self._fail_compile,
+        )
+
+    # SONAR_BUILD_TYPE -> scan function of scan_java_proj
+    _JAVA_BUILD_SCANS = {
+        "any": _scan_java_no_build,
+        "no_build": _scan_java_no_build,
+        "gradle": _scan_java_gradle,
+        "maven": _scan_java_maven,
+        "mvn": _scan_java_maven,
+        "ant": _scan_java_ant,
+    }
 
     def scan_cs_proj(self, build_cmd, build_cwd):
         if not build_cmd:
@@ -868,9 +1055,9 @@ class SonarQube(object):
         scan_cmd = [
             "SonarScanner.MSBuild.exe",
             "begin",
-        ] + self.change_to_vs_cmd(self.com_cmd)
-        self.run_cmd(command=scan_cmd, cwd=build_cwd, cmd_type="compile")
-        self.run_cmd(command=shlex.split(self.generate_shell_file(build_cmd)), cwd=build_cwd, cmd_type="compile")
+        ] + [self._to_vs_arg(c) for c in self.com_cmd]
+        self.run_cmd(command=scan_cmd, cwd=build_cwd, on_fail=self._fail_compile)
+        self.run_cmd(command=shlex.split(self.generate_shell_file(build_cmd)), cwd=build_cwd, on_fail=self._fail_compile)
         self.run_cmd(
             command=[
                 "SonarScanner.MSBuild.exe",
@@ -879,73 +1066,75 @@ class SonarQube(object):
                 '/d:sonar.password="%s"' % self.password,
             ],
             cwd=build_cwd,
-            cmd_type="analyze",
+            on_fail=self._fail_analyze,
         )
-        if self.scannerwork and os.path.exists(self.scannerwork):
-            return os.path.join(self.scannerwork, "report-task.txt")
-        return os.path.join(build_cwd, ".sonarqube", "out", ".sonar", "report-task.txt")
+        return self._report_task_path(build_cwd, ".sonarqube", "out", ".sonar")
 
         # TODO: 2. for .NET Core
 
     def scan_not_build_proj(self, build_cwd):
-        scan_cmd = [
-            "sonar-scanner",
-            "-X",
-            "-Dsonar.sources=%s" % os.environ.get("SONAR_SRC", "."),
-            "-Dsonar.java.binaries=%s" % os.environ.get("SONAR_BIN", "**/*"),
-        ] + self.com_cmd
-        analyze_options = os.environ.get("SQ_ANALYZE_OPTIONS", "")
+        scan_cmd = (
+            self._change_to_win_cmd(
+                [
+                    "sonar-scanner",
+                    "-X",
+                    "-Dsonar.sources=%s" % (self._env["SONAR_SRC"] or "."),
+                    "-Dsonar.java.binaries=%s" % (self._env["SONAR_BIN"] or "**/*"),
+                ]
+            )
+            + self._com_cmd_win
+        )
+        analyze_options = self._env["SQ_ANALYZE_OPTIONS"]
         if analyze_options:
             # -Dsonar.javascript.globals=
             # -Dsonar.javascript.environments=
-            scan_cmd.extend(analyze_options.split())
-        scan_cmd = self._change_to_win_cmd(scan_cmd)
-        self.run_cmd(command=scan_cmd, cwd=build_cwd, cmd_type="analyze")
-
-        if self.scannerwork and os.path.exists(self.scannerwork):
-            return os.path.join(self.scannerwork, "report-task.txt")
-        return os.path.join(build_cwd, ".scannerwork", "report-task.txt")
-
-    def _sonar_path_filter(self, path_list):
-        temp = list()
-        for path in path_list:
-            temp.append(path.replace("*", "***"))
-        return temp
-
-    def _sonar_regex_path_filter(self, path_list):
-        temp = list()
-        for path in path_list:
-            temp.append(path.replace(".*", "***"))
-        return temp
+            scan_cmd.extend(self._change_to_win_cmd(analyze_options.split()))
+        self.run_cmd(command=scan_cmd, cwd=build_cwd, on_fail=self._fail_analyze)
+
+        return self._report_task_path(build_cwd, ".scannerwork")
+
+    def _report_task_path(self, build_cwd, *default_dirs):
+        """
+        :param build_cwd:
+        :param default_dirs: report dir of the scanner relative to build_cwd, used without the scannerwork dir
+        :return: path of report-task.txt
+        """
+        if os.path.exists(self.scannerwork):
+            return self._scannerwork_report
+        return os.path.join(build_cwd, *default_dirs, "report-task.txt")
+
+    @staticmethod
+    def _sonar_filter_value(wild_paths, *re_path_lists):
+        """
+        Convert the TCA path filters to sonar wildcards and join them into one option value
+        :param wild_paths: wildcard paths
+        :param re_path_lists: lists of regex paths
+        :return: str, empty when there is no path
+        """
+        return ",".join(
+            itertools.chain(
+                (path.replace("*", "***") for path in wild_paths),
+                (path.replace(".*", "***") for path in itertools.chain.from_iterable(re_path_lists)),
+            )
+        )
 
     def _add_sonar_filter_path(self):
-        path_wild_exclude = self.params["path_filters"].get("wildcard_exclusion", [])
-        path_wild_include = self.params["path_filters"].get("wildcard_inclusion", [])
-        path_re_exclude = self.params["path_filters"].get("re_exclusion", [])
-        path_re_include = self.params["path_filters"].get("re_inclusion", [])
-        path_yaml_filters = self.params["path_filters"].get("yaml_filters", {})
-        path_yaml_exclude = path_yaml_filters.get("lint_exclusion", [])
-        path_yaml_include = path_yaml_filters.get("lint_inclusion", [])
-
-        sonar_include = list()
-        if path_wild_include:
-            sonar_include.extend(self._sonar_path_filter(path_wild_include))
-        if path_re_include:
-            sonar_include.extend(self._sonar_regex_path_filter(path_re_include))
-        if path_yaml_include:
-            sonar_include.extend(self._sonar_regex_path_filter(path_yaml_include))
-        sonar_exclude = list()
-        if path_wild_exclude:
-            sonar_exclude.extend(self._sonar_path_filter(path_wild_exclude))
-        if path_re_exclude:
-            sonar_exclude.extend(self._sonar_regex_path_filter(path_re_exclude))
-        if path_yaml_exclude:
-            sonar_exclude.extend(self._sonar_regex_path_filter(path_yaml_exclude))
+        path_filters = self.params["path_filters"]
+        path_wild_exclude = path_filters.get("wildcard_exclusion") or _EMPTY
+        path_wild_include = path_filters.get("wildcard_inclusion") or _EMPTY
+        path_re_exclude = path_filters.get("re_exclusion") or _EMPTY
+        path_re_include = path_filters.get("re_inclusion") or _EMPTY
+        path_yaml_filters = path_filters.get("yaml_filters") or {}
+        path_yaml_exclude = path_yaml_filters.get("lint_exclusion") or _EMPTY
+        path_yaml_include = path_yaml_filters.get("lint_inclusion") or _EMPTY
+
+        sonar_include = self._sonar_filter_value(path_wild_include, path_re_include, path_yaml_include)
+        sonar_exclude = self._sonar_filter_value(path_wild_exclude, path_re_exclude, path_yaml_exclude)
 
         if sonar_include:
-            self.com_cmd.append('-Dsonar.inclusions="%s"' % ",".join(sonar_include))
+            self.com_cmd.append('-Dsonar.inclusions="%s"' % sonar_include)
         if sonar_exclude:
-            self.com_cmd.append('-Dsonar.exclusions="%s"' % ",".join(sonar_exclude))
+            self.com_cmd.append('-Dsonar.exclusions="%s"' % sonar_exclude)
 
 
 tool = SonarQube